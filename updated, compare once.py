@@ -1,9 +1,8 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
-import yfinance as yf
 from datetime import datetime
-import plotly.graph_objects as go
-import plotly.express as px
+from operator import itemgetter
 import math
 
 # --- SETTINGS & THEME ---
@@ -29,63 +28,116 @@ st.markdown("""
     """, unsafe_allow_html=True)
 
 # --- LIVE MARKET DATA FUNCTION ---
+@st.cache_resource
+def _yf_session():
+    # One persistent session so TTL refreshes reuse the TCP+TLS handshake
+    import requests
+    s = requests.Session()
+    s.headers.update({'User-Agent': 'Mozilla/5.0'})
+    return s
+
 @st.cache_data(ttl=3600)
 def fetch_live_market_data():
+    import yfinance as yf  # deferred: heavy import, function runs once per cache TTL
     try:
-        usd_inr_data = yf.download('INR=X', period='5d', progress=False)['Close']
-        usd_inr = float(usd_inr_data.iloc[-1])
-        nifty_data = yf.download('^NSEI', period='1y', progress=False)['Close']
+        session = _yf_session()
+        # Spot tickers only need the latest close; Nifty needs 200 sessions for the SMA
+        spot = yf.download('INR=X GC=F SI=F', period='2d', progress=False, threads=True, session=session)['Close']
+        nifty_data = yf.download('^NSEI', period='250d', progress=False, session=session)['Close'].dropna()
+        usd_inr = float(spot['INR=X'].dropna().iloc[-1])
         nifty_current = float(nifty_data.iloc[-1])
-        nifty_sma200 = float(nifty_data.rolling(window=200).mean().iloc[-1])
+        nifty_sma200 = float(nifty_data.to_numpy()[-200:].mean())
         is_bullish = nifty_current > nifty_sma200
-        gold_data = yf.download('GC=F', period='5d', progress=False)['Close']
-        gold_usd_oz = float(gold_data.iloc[-1])
+        gold_usd_oz = float(spot['GC=F'].dropna().iloc[-1])
         gold_inr_gram = (gold_usd_oz / 31.1035) * usd_inr
-        silver_data = yf.download('SI=F', period='5d', progress=False)['Close']
-        silver_usd_oz = float(silver_data.iloc[-1])
+        silver_usd_oz = float(spot['SI=F'].dropna().iloc[-1])
         silver_inr_gram = (silver_usd_oz / 31.1035) * usd_inr
         return {'usd_inr': usd_inr, 'nifty': nifty_current, 'is_bullish': is_bullish, 'gold_gram': gold_inr_gram, 'silver_gram': silver_inr_gram}
     except Exception:
         return {'usd_inr': 90.66, 'nifty': 23000, 'is_bullish': True, 'gold_gram': 7200, 'silver_gram': 95}
 
 # --- CALCULATION FUNCTIONS (STEP-UP READY) ---
+INFLATION_RATE = 0.06
+
+
 def calculate_fv_step_up(rate, years, sip, lumpsum, step_up_pct):
     r = rate / 12
-    total_fv_sip = 0
-    current_sip = sip
     fv_lump = lumpsum * ((1 + r) ** (years * 12))
-    for year in range(1, int(years) + 1):
-        months_remaining = (years - year) * 12
-        year_fv = 0
-        for month in range(12):
-            year_fv += current_sip * ((1 + r) ** (months_remaining + (12 - month - 1)))
-        total_fv_sip += year_fv
-        current_sip *= (1 + step_up_pct)
+    full_years = int(years)
+    growth = 1 + step_up_pct
+    if r == 0:
+        # No compounding: FV is just the sum of contributions
+        total_fv_sip = sip * 12 * (full_years if step_up_pct == 0 else (growth ** full_years - 1) / step_up_pct)
+        fractional_months = int((years - full_years) * 12)
+        total_fv_sip += sip * (growth ** full_years) * fractional_months
+        return fv_lump + total_fv_sip
+    R = (1 + r) ** 12
+    # FV of one year of monthly SIPs, measured at year end (geometric sum over 12 months)
+    annuity = sip * (R - 1) / r
+    # Sum over years of growth**(year-1) * R**(years-year) is itself geometric
+    if abs(R - growth) < 1e-12:
+        series = full_years * R ** (full_years - 1)
+    else:
+        series = (R ** full_years - growth ** full_years) / (R - growth)
+    total_fv_sip = annuity * series * R ** (years - full_years)
     # Handle fractional months if any
-    fractional_months = (years - int(years)) * 12
+    fractional_months = int((years - full_years) * 12)
     if fractional_months > 0:
-        for m in range(int(fractional_months)):
-            total_fv_sip += current_sip * ((1 + r) ** (int(fractional_months) - m - 1))
+        current_sip = sip * growth ** full_years
+        total_fv_sip += current_sip * (((1 + r) ** fractional_months - 1) / r)
     return fv_lump + total_fv_sip
 
 def calculate_required_sip_step_up(target, rate, years, lumpsum, step_up_pct):
-    low = 0
-    high = max(target / 12, 1000000)
-    for _ in range(50):
-        mid = (low + high) / 2
-        fv = calculate_fv_step_up(rate, years, mid, lumpsum, step_up_pct)
-        if fv < target: low = mid
-        else: high = mid
-    return high
+    # FV is linear in sip, so one exact Newton step: a single division
+    fv_lump = calculate_fv_step_up(rate, years, 0.0, float(lumpsum), step_up_pct)
+    fv_per_unit = calculate_fv_step_up(rate, years, 1.0, 0.0, step_up_pct)
+    if fv_per_unit <= 0:
+        return 0.0
+    return max(0.0, (float(target) - fv_lump) / fv_per_unit)
+
+def compute_goal_analysis(goal_configs, cagr, lumpsum, sip, step_up_pct):
+    curr_corpus = lumpsum; total_inv = lumpsum; run_sip = sip
+
+    # Vectorized precomputation: inflation targets and goal gaps in one pass
+    years_arr = np.array([g['years'] for g in goal_configs], dtype=float)
+    amt_arr = np.array([g['amount'] for g in goal_configs], dtype=float)
+    gaps = np.diff(np.concatenate(([0.0], years_arr)))
+    targets_inf = amt_arr * np.power(1 + INFLATION_RATE, years_arr)
+
+    rows = []
+    for i, goal in enumerate(goal_configs):
+        gap = gaps[i]
+        pre_tax = calculate_fv_step_up(cagr, gap, run_sip, curr_corpus, step_up_pct)
+
+        # Tracking investment for tax (geometric sum of stepped-up contributions)
+        inv_period = run_sip * 12 * (int(gap) if step_up_pct == 0 else ((1 + step_up_pct) ** int(gap) - 1) / step_up_pct)
+        total_inv += inv_period
+
+        tax = max(0, (pre_tax - total_inv) - 125000) * 0.125
+        post_tax = pre_tax - tax
+        target_inf = float(targets_inf[i])
+
+        req_sip = None
+        if post_tax < target_inf:
+            req_sip = calculate_required_sip_step_up(target_inf, cagr, goal['years'], lumpsum, step_up_pct)
+            curr_corpus = 0
+        else:
+            curr_corpus = post_tax - target_inf
+            total_inv = curr_corpus
+        rows.append({'name': goal['name'], 'years': goal['years'], 'post_tax': post_tax, 'target_inf': target_inf, 'req_sip': req_sip})
+
+        run_sip *= ((1 + step_up_pct) ** gap)
+    return rows
+
+# Strategic base weights
+_STRATEGIC_ALLOCS = {
+    'Conservative': {'Equity Index': 15, 'Debt Funds': 45, 'Govt Bonds': 30, 'Gold': 10},
+    'Balanced': {'Equity Flexi': 50, 'Debt Funds': 25, 'Corp Bonds': 15, 'Gold': 10},
+    'Aggressive': {'Equity Mid/Small': 75, 'Intl Equity': 10, 'Debt/Cash': 10, 'Gold': 5}
+}
 
 def get_allocation_tactical(risk_type, is_bullish):
-    # Strategic base weights
-    allocs = {
-        'Conservative': {'Equity Index': 15, 'Debt Funds': 45, 'Govt Bonds': 30, 'Gold': 10},
-        'Balanced': {'Equity Flexi': 50, 'Debt Funds': 25, 'Corp Bonds': 15, 'Gold': 10},
-        'Aggressive': {'Equity Mid/Small': 75, 'Intl Equity': 10, 'Debt/Cash': 10, 'Gold': 5}
-    }
-    base = allocs.get(risk_type, allocs['Balanced']).copy()
+    base = dict(_STRATEGIC_ALLOCS.get(risk_type, _STRATEGIC_ALLOCS['Balanced']))
     if not is_bullish:
         equity_key = [k for k in base.keys() if 'Equity' in k][0]
         base[equity_key] -= 10
@@ -94,6 +146,32 @@ def get_allocation_tactical(risk_type, is_bullish):
         base[debt_target] += 7
     return base
 
+# Only 6 possible (risk_type, is_bullish) combinations; precompute them once at import
+_ALLOC_CACHE = {
+    (rt, bull): (alloc, pd.DataFrame({'Asset': list(alloc), 'Weight %': list(alloc.values())}))
+    for rt in ('Conservative', 'Balanced', 'Aggressive')
+    for bull in (True, False)
+    for alloc in (get_allocation_tactical(rt, bull),)
+}
+
+@st.cache_data
+def build_allocation_figure(risk_type, is_bullish):
+    import plotly.graph_objects as go  # deferred: only needed once a plan is generated
+    alloc, _ = _ALLOC_CACHE[(risk_type, is_bullish)]
+    fig = go.Figure(data=[go.Pie(labels=list(alloc), values=list(alloc.values()))])
+    fig.update_layout(title=f"Tactical {risk_type} Split")
+    return fig
+
+_RISK_LABELS = ("Select Profile...", "Conservative (7.5% CAGR)", "Balanced (9-10.5% CAGR)", "Aggressive (11.5-14.5% CAGR)")
+
+@st.cache_data
+def get_risk_choices(is_bullish):
+    return {
+        "Conservative (7.5% CAGR)": {'cagr': 0.075, 'type': 'Conservative'},
+        "Balanced (9-10.5% CAGR)": {'cagr': 0.105 if is_bullish else 0.09, 'type': 'Balanced'},
+        "Aggressive (11.5-14.5% CAGR)": {'cagr': 0.145 if is_bullish else 0.115, 'type': 'Aggressive'}
+    }
+
 # --- MAIN APP ---
 market_data = fetch_live_market_data()
 st.title("🏦 WealthMax India v70.0 - Enhanced Edition")
@@ -117,12 +195,7 @@ with col_a:
     sip = st.number_input("Starting Monthly SIP (₹)", min_value=0, value=0)
     step_up_pct = st.slider("Annual SIP Step-Up (%)", 0, 25, 10) / 100
 with col_b:
-    risk_choices = {
-        "Conservative (7.5% CAGR)": {'cagr': 0.075, 'type': 'Conservative'},
-        "Balanced (9-10.5% CAGR)": {'cagr': 0.105 if market_data['is_bullish'] else 0.09, 'type': 'Balanced'},
-        "Aggressive (11.5-14.5% CAGR)": {'cagr': 0.145 if market_data['is_bullish'] else 0.115, 'type': 'Aggressive'}
-    }
-    risk_choice = st.selectbox("Risk Profile", ["Select Profile..."] + list(risk_choices.keys()))
+    risk_choice = st.selectbox("Risk Profile", _RISK_LABELS)
 
 st.divider()
 
@@ -135,75 +208,71 @@ life_events_db = {
 }
 selected_events = st.multiselect("Select Goals", list(life_events_db.keys()))
 goal_configs = []
-for event in selected_events:
-    with st.expander(f"⚙️ {event.upper()} CONFIG"):
-        col1, col2, col3 = st.columns(3)
-        with col1: amt = st.number_input("Target (₹)", key=f"a_{event}", min_value=0)
-        if life_events_db[event]['emg']: yrs = 0
-        elif life_events_db[event]['age']:
-            with col2: c_age = st.number_input("Child Age", key=f"c_{event}", value=0)
-            with col3: t_age = st.number_input("Target Age", key=f"t_{event}", value=18)
-            yrs = max(1, t_age - c_age) if c_age > 0 else 0
-        else:
-            with col2: yrs = st.number_input("Years to Goal", key=f"y_{event}", value=0)
-        if amt > 0: goal_configs.append({'name': event, 'amount': amt, 'years': yrs})
+# Form batches the goal widgets so typing elsewhere doesn't rerun them
+with st.form("plan_form"):
+    for event in selected_events:
+        with st.expander(f"⚙️ {event.upper()} CONFIG"):
+            col1, col2, col3 = st.columns(3)
+            with col1: amt = st.number_input("Target (₹)", key=f"a_{event}", min_value=0)
+            if life_events_db[event]['emg']: yrs = 0
+            elif life_events_db[event]['age']:
+                with col2: c_age = st.number_input("Child Age", key=f"c_{event}", value=0)
+                with col3: t_age = st.number_input("Target Age", key=f"t_{event}", value=18)
+                yrs = max(1, t_age - c_age) if c_age > 0 else 0
+            else:
+                with col2: yrs = st.number_input("Years to Goal", key=f"y_{event}", value=0)
+            if amt > 0: goal_configs.append({'name': event, 'amount': amt, 'years': yrs})
+    generate_plan = st.form_submit_button("🚀 GENERATE WEALTH PLAN", type="primary")
+
+goal_configs.sort(key=itemgetter('years'))
+plan_key = (client_name, lumpsum, sip, step_up_pct, risk_choice,
+            tuple((g['name'], g['amount'], g['years']) for g in goal_configs))
 
-if st.button("🚀 GENERATE WEALTH PLAN", type="primary"):
+if generate_plan:
     if not client_name or risk_choice == "Select Profile..." or not goal_configs:
         st.error("Missing Inputs!")
     else:
-        goal_configs = sorted(goal_configs, key=lambda x: x['years'])
-        config = risk_choices[risk_choice]; cagr = config['cagr']; risk_type = config['type']
-        
-        st.markdown(f"<h1 class='report-title'>📊 WEALTH REPORT: {client_name.upper()}</h1>", unsafe_allow_html=True)
-        
-        # SECTION 1: MARKET
-        st.markdown('<div class="section-header">[SECTION 1: AI MARKET VALIDATION]</div>', unsafe_allow_html=True)
-        col1, col2, col3 = st.columns(3)
-        col1.metric("Sentiment", "BULLISH" if market_data['is_bullish'] else "BEARISH")
-        col2.metric("Tactical Shift", "OFFENSIVE" if market_data['is_bullish'] else "DEFENSIVE")
-        col3.metric("Projected CAGR", f"{cagr*100:.1f}%")
-        
-        # SECTION 2: SEQUENTIAL GOALS
-        st.markdown('<div class="section-header">[SECTION 2: STEP-UP GOAL ANALYSIS]</div>', unsafe_allow_html=True)
-        curr_corpus = lumpsum; total_inv = lumpsum; run_sip = sip; last_yr = 0
-        
-        for goal in goal_configs:
-            gap = goal['years'] - last_yr
-            pre_tax = calculate_fv_step_up(cagr, gap, run_sip, curr_corpus, step_up_pct)
-            
-            # Tracking investment for tax
-            inv_period = 0; temp_sip = run_sip
-            for _ in range(int(gap)):
-                inv_period += (temp_sip * 12)
-                temp_sip *= (1 + step_up_pct)
-            total_inv += inv_period
-            
-            tax = max(0, (pre_tax - total_inv) - 125000) * 0.125
-            post_tax = pre_tax - tax
-            target_inf = goal['amount'] * (1.06 ** goal['years'])
-            
-            st.markdown(f"### 🎯 {goal['name']} (Year {goal['years']})")
-            st.markdown(f'<div class="math-box"><b>Wealth:</b> ₹{post_tax:,.0f}<br><b>Goal:</b> ₹{target_inf:,.0f}</div>', unsafe_allow_html=True)
-            
-            if post_tax < target_inf:
-                req = calculate_required_sip_step_up(target_inf, cagr, goal['years'], lumpsum, step_up_pct)
-                st.error(f"❌ Shortfall: ₹{target_inf - post_tax:,.0f}")
-                st.info(f"💡 Starting SIP required: ₹{req:,.0f} (at {step_up_pct*100}% step-up)")
-                curr_corpus = 0
-            else:
-                st.success(f"✅ Achieved! Surplus: ₹{post_tax - target_inf:,.0f}")
-                curr_corpus = post_tax - target_inf
-                total_inv = curr_corpus
-            
-            run_sip *= ((1 + step_up_pct) ** gap)
-            last_yr = goal['years']
-            st.divider()
-
-        # SECTION 3: ALLOCATION
-        st.markdown('<div class="section-header">[SECTION 3: TACTICAL ASSET ALLOCATION]</div>', unsafe_allow_html=True)
-        alloc = get_allocation_tactical(risk_type, market_data['is_bullish'])
-        df_alloc = pd.DataFrame([{'Asset': k, 'Weight %': v} for k, v in alloc.items()])
-        st.dataframe(df_alloc, use_container_width=True, hide_index=True)
-        fig = px.pie(df_alloc, values='Weight %', names='Asset', title=f"Tactical {risk_type} Split")
-        st.plotly_chart(fig, use_container_width=True)
+        config = get_risk_choices(market_data['is_bullish'])[risk_choice]
+        # Compute once and persist, so the report survives later reruns
+        st.session_state['report'] = {
+            'key': plan_key,
+            'client_name': client_name,
+            'cagr': config['cagr'],
+            'risk_type': config['type'],
+            'is_bullish': market_data['is_bullish'],
+            'step_up_pct': step_up_pct,
+            'goals': compute_goal_analysis(goal_configs, config['cagr'], lumpsum, sip, step_up_pct)
+        }
+
+report = st.session_state.get('report')
+if report is not None and report['key'] == plan_key:
+    cagr = report['cagr']; risk_type = report['risk_type']; is_bullish = report['is_bullish']
+
+    st.markdown(f"<h1 class='report-title'>📊 WEALTH REPORT: {report['client_name'].upper()}</h1>", unsafe_allow_html=True)
+
+    # SECTION 1: MARKET
+    st.markdown('<div class="section-header">[SECTION 1: AI MARKET VALIDATION]</div>', unsafe_allow_html=True)
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Sentiment", "BULLISH" if is_bullish else "BEARISH")
+    col2.metric("Tactical Shift", "OFFENSIVE" if is_bullish else "DEFENSIVE")
+    col3.metric("Projected CAGR", f"{cagr*100:.1f}%")
+
+    # SECTION 2: SEQUENTIAL GOALS
+    st.markdown('<div class="section-header">[SECTION 2: STEP-UP GOAL ANALYSIS]</div>', unsafe_allow_html=True)
+    for row in report['goals']:
+        st.markdown(f"### 🎯 {row['name']} (Year {row['years']})")
+        st.markdown(f'<div class="math-box"><b>Wealth:</b> ₹{row["post_tax"]:,.0f}<br><b>Goal:</b> ₹{row["target_inf"]:,.0f}</div>', unsafe_allow_html=True)
+
+        if row['req_sip'] is not None:
+            st.error(f"❌ Shortfall: ₹{row['target_inf'] - row['post_tax']:,.0f}")
+            st.info(f"💡 Starting SIP required: ₹{row['req_sip']:,.0f} (at {report['step_up_pct']*100}% step-up)")
+        else:
+            st.success(f"✅ Achieved! Surplus: ₹{row['post_tax'] - row['target_inf']:,.0f}")
+        st.divider()
+
+    # SECTION 3: ALLOCATION
+    st.markdown('<div class="section-header">[SECTION 3: TACTICAL ASSET ALLOCATION]</div>', unsafe_allow_html=True)
+    _, df_alloc = _ALLOC_CACHE[(risk_type, is_bullish)]
+    fig = build_allocation_figure(risk_type, is_bullish)
+    st.table(df_alloc.set_index('Asset'))
+    st.plotly_chart(fig, use_container_width=True)